@@ -4,11 +4,29 @@ Configuration loader for the Mini Cluster Setup
 Loads configuration from config.yml and provides utilities for environment variable export
 """
 
+import copy
+import functools
 import yaml
 import os
 import sys
 from pathlib import Path
 
+# Prefer the libyaml-backed loader when PyYAML was built with it
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Marks a dotted path that is absent from the config in the lookup cache
+_MISSING = object()
+
+
+@functools.lru_cache(maxsize=8)
+def _load_yaml(path, mtime):
+    """
+    Parse a YAML file once per (path, mtime)
+    mtime is part of the cache key, so editing the file invalidates the entry
+    """
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=Loader)
+
 
 class ConfigLoader:
     def __init__(self, config_path="config.yml"):
@@ -17,24 +35,38 @@ class ConfigLoader:
         if not self.config_path.exists():
             raise FileNotFoundError(f"Configuration file not found: {config_path}")
         
-        with open(self.config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        # Each loader gets its own copy so mutations don't leak into the cache
+        self.config = copy.deepcopy(
+            _load_yaml(str(self.config_path), self.config_path.stat().st_mtime)
+        )
+        
+        # Resolved dotted-path lookups, see get()
+        self._path_cache = {}
     
     def get(self, key_path, default=None):
         """
         Get configuration value using dot notation
         Example: get('kafka.partitions') returns config['kafka']['partitions']
         """
-        keys = key_path.split('.')
-        value = self.config
-        
-        for key in keys:
-            if isinstance(value, dict) and key in value:
-                value = value[key]
-            else:
-                return default
+        try:
+            value = self._path_cache[key_path]
+        except KeyError:
+            value = self.config
+            for key in key_path.split('.'):
+                if isinstance(value, dict) and key in value:
+                    value = value[key]
+                else:
+                    value = _MISSING
+                    break
+            self._path_cache[key_path] = value
         
-        return value
+        return default if value is _MISSING else value
+    
+    def clear_cache(self):
+        """
+        Drop cached get() lookups, call after mutating self.config
+        """
+        self._path_cache.clear()
     
     def get_kafka_config(self):
         """Get all Kafka-related configuration"""
@@ -87,30 +119,34 @@ class ConfigLoader:
         """
         env_vars = self.to_env_vars()
         
+        parts = []
+        parts.append("# Auto-generated from config.yml - DO NOT EDIT MANUALLY\n")
+        parts.append("# Edit config.yml instead and regenerate this file\n\n")
+        
+        # Group related variables
+        parts.append("# ===== Kafka =====\n")
+        for key in ['KAFKA_KRAFT_CLUSTER_ID', 'KAFKA_PARTITIONS', 'KAFKA_REPLICATION_FACTOR', 'KAFKA_MIN_INSYNC']:
+            if key in env_vars:
+                parts.append(f"{key}={env_vars[key]}\n")
+        
+        parts.append("\n# Host-exposed ports for each broker\n")
+        for key in ['KAFKA_1_EXTERNAL', 'KAFKA_2_EXTERNAL', 'KAFKA_3_EXTERNAL']:
+            if key in env_vars:
+                parts.append(f"{key}={env_vars[key]}\n")
+        
+        parts.append("\n# ===== Spark =====\n")
+        for key in ['SPARK_WORKER_MEMORY', 'SPARK_WORKER_CORES']:
+            if key in env_vars:
+                parts.append(f"{key}={env_vars[key]}\n")
+        
+        parts.append("\n# ===== Generator =====\n")
+        for key in ['EVENTS_PER_SEC_CLICK', 'EVENTS_PER_SEC_IOT']:
+            if key in env_vars:
+                parts.append(f"{key}={env_vars[key]}\n")
+        
+        # Write the whole file in one call
         with open(output_path, 'w') as f:
-            f.write("# Auto-generated from config.yml - DO NOT EDIT MANUALLY\n")
-            f.write("# Edit config.yml instead and regenerate this file\n\n")
-            
-            # Group related variables
-            f.write("# ===== Kafka =====\n")
-            for key in ['KAFKA_KRAFT_CLUSTER_ID', 'KAFKA_PARTITIONS', 'KAFKA_REPLICATION_FACTOR', 'KAFKA_MIN_INSYNC']:
-                if key in env_vars:
-                    f.write(f"{key}={env_vars[key]}\n")
-            
-            f.write("\n# Host-exposed ports for each broker\n")
-            for key in ['KAFKA_1_EXTERNAL', 'KAFKA_2_EXTERNAL', 'KAFKA_3_EXTERNAL']:
-                if key in env_vars:
-                    f.write(f"{key}={env_vars[key]}\n")
-            
-            f.write("\n# ===== Spark =====\n")
-            for key in ['SPARK_WORKER_MEMORY', 'SPARK_WORKER_CORES']:
-                if key in env_vars:
-                    f.write(f"{key}={env_vars[key]}\n")
-            
-            f.write("\n# ===== Generator =====\n")
-            for key in ['EVENTS_PER_SEC_CLICK', 'EVENTS_PER_SEC_IOT']:
-                if key in env_vars:
-                    f.write(f"{key}={env_vars[key]}\n")
+            f.write("".join(parts))
     
     def export_to_shell(self):
         """
@@ -0,0 +1,194 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Compiled JSON renderers for the data generator hot loop
+Random draws stay in NumPy (data_gen.py); these functions only assemble the
+fixed-shape records straight into bytes objects. data_gen.py falls back to the
+pure-Python renderers when this module isn't compiled.
+"""
+
+from cpython.bytes cimport PyBytes_AS_STRING, PyBytes_FromStringAndSize, PyBytes_GET_SIZE
+from libc.math cimport fabs, isfinite, llround
+from libc.stdio cimport snprintf
+from libc.string cimport memcpy, strlen
+
+cdef const char* HEX = b"0123456789abcdef"
+
+# Clickstream record layout, must match _CLICK_TMPL in data_gen.py
+cdef const char* C_EVENT_ID = b'{"event_id":"'
+cdef const char* C_USER_ID = b'","user_id":"'
+cdef const char* C_REFERRER = b'","referrer":'
+cdef const char* C_SESSION = b',"session_id":"s'
+cdef const char* C_TS = b'","ts":"'
+cdef const char* C_TAIL = b'",'
+cdef Py_ssize_t CLICK_FIXED_LEN = (
+    strlen(C_EVENT_ID) + strlen(C_USER_ID) + strlen(C_REFERRER)
+    + strlen(C_SESSION) + strlen(C_TS) + strlen(C_TAIL)
+)
+
+# IoT record layout, same fields as the orjson path in data_gen.py
+cdef const char* I_DEVICE_ID = b'{"device_id":"'
+cdef const char* I_SITE = b'","site":'
+cdef const char* I_TEMP = b',"temp_c":'
+cdef const char* I_HUMIDITY = b',"humidity":'
+cdef const char* I_BATTERY = b',"battery":'
+cdef const char* I_SIGNAL = b',"signal_strength":'
+cdef const char* I_TS = b',"ts":"'
+cdef const char* I_END = b'"}'
+cdef Py_ssize_t IOT_FIXED_LEN = (
+    strlen(I_DEVICE_ID) + strlen(I_SITE) + strlen(I_TEMP) + strlen(I_HUMIDITY)
+    + strlen(I_BATTERY) + strlen(I_SIGNAL) + strlen(I_TS) + strlen(I_END)
+)
+
+
+cdef inline Py_ssize_t put(char* out, Py_ssize_t pos, const char* piece, Py_ssize_t n):
+    memcpy(out + pos, piece, n)
+    return pos + n
+
+
+cdef inline Py_ssize_t put_bytes(char* out, Py_ssize_t pos, bytes piece):
+    return put(out, pos, PyBytes_AS_STRING(piece), PyBytes_GET_SIZE(piece))
+
+
+cdef inline int format_fixed(char* out, double x, int decimals) except -1:
+    """Write x with a fixed number of decimals (values are pre-rounded), returns the length"""
+    if not isfinite(x) or fabs(x) >= 1e15:
+        # Scaled past llround's long long range, and NaN/inf aren't valid JSON numbers anyway
+        raise ValueError(f"float {x!r} can't be rendered, must be finite with magnitude below 1e15")
+    cdef long long scale = 10 if decimals == 1 else 100
+    cdef long long v = llround(x * scale)
+    cdef int n = 0
+    if v < 0:
+        out[0] = b'-'
+        n = 1
+        v = -v
+    n += snprintf(out + n, 24, b"%lld", v // scale)
+    out[n] = b'.'
+    n += 1
+    if decimals == 2:
+        out[n] = <char>(48 + (v // 10) % 10)
+        n += 1
+    out[n] = <char>(48 + v % 10)
+    return n + 1
+
+
+cdef inline bytes pool_item(list pool, object idx):
+    """Look up a pool entry, checked by hand since indexing is compiled without bounds checks"""
+    cdef Py_ssize_t i = idx
+    if i < 0 or i >= len(pool):
+        raise ValueError(f"index {i} out of range for a pool of {len(pool)}")
+    item = pool[i]
+    if type(item) is not bytes:
+        raise TypeError("pool entries must be bytes")
+    return <bytes>item
+
+
+cdef check_lengths(Py_ssize_t n, lists):
+    for values in lists:
+        if len(values) != n:
+            raise ValueError("every per-event list must have one entry per event")
+
+
+def render_clickstream(bytes random_bytes not None, list uid_idx not None, list pair_idx not None,
+                       list ref_idx not None, list sessions not None, bytes ts not None,
+                       list uids not None, list refs not None, list tails not None):
+    """
+    Render clickstream JSON values, returns a list of (key, value) bytes pairs
+    random_bytes holds 16 bytes per event, hex-encoded into event_id; uids double
+    as the Kafka keys, refs and tails are already JSON-escaped
+    """
+    cdef Py_ssize_t n = len(uid_idx)
+    if PyBytes_GET_SIZE(random_bytes) < 16 * n:
+        raise ValueError("random_bytes must hold 16 bytes per event")
+    check_lengths(n, (pair_idx, ref_idx, sessions))
+
+    cdef const unsigned char* rnd = <const unsigned char*>PyBytes_AS_STRING(random_bytes)
+    cdef Py_ssize_t i, j, pos, size
+    cdef char num[24]
+    cdef int num_len
+    cdef unsigned char byte
+    cdef bytes uid, ref, tail, value
+    cdef char* out
+    cdef list events = []
+
+    for i in range(n):
+        uid = pool_item(uids, uid_idx[i])
+        ref = pool_item(refs, ref_idx[i])
+        tail = pool_item(tails, pair_idx[i])
+        num_len = snprintf(num, sizeof(num), b"%ld", <long>sessions[i])
+
+        size = (CLICK_FIXED_LEN + 32 + PyBytes_GET_SIZE(uid) + PyBytes_GET_SIZE(ref)
+                + num_len + PyBytes_GET_SIZE(ts) + PyBytes_GET_SIZE(tail))
+        value = PyBytes_FromStringAndSize(NULL, size)
+        out = PyBytes_AS_STRING(value)
+
+        pos = put(out, 0, C_EVENT_ID, strlen(C_EVENT_ID))
+        for j in range(16):
+            byte = rnd[16 * i + j]
+            out[pos] = HEX[byte >> 4]
+            out[pos + 1] = HEX[byte & 15]
+            pos += 2
+        pos = put(out, pos, C_USER_ID, strlen(C_USER_ID))
+        pos = put_bytes(out, pos, uid)
+        pos = put(out, pos, C_REFERRER, strlen(C_REFERRER))
+        pos = put_bytes(out, pos, ref)
+        pos = put(out, pos, C_SESSION, strlen(C_SESSION))
+        pos = put(out, pos, num, num_len)
+        pos = put(out, pos, C_TS, strlen(C_TS))
+        pos = put_bytes(out, pos, ts)
+        pos = put(out, pos, C_TAIL, strlen(C_TAIL))
+        put_bytes(out, pos, tail)
+
+        events.append((uid, value))
+    return events
+
+
+def render_iot(list did_idx not None, list site_idx not None, list temps not None,
+               list hum not None, list batt not None, list sig not None, bytes ts not None,
+               list dids not None, list sites not None):
+    """
+    Render IoT JSON values, returns a list of (key, value) bytes pairs
+    dids double as the Kafka keys, sites are already JSON-escaped; temp_c and
+    humidity are written with 2 decimals, battery with 1
+    """
+    cdef Py_ssize_t i, pos, size, n = len(did_idx)
+    cdef char t_buf[32]
+    cdef char h_buf[32]
+    cdef char b_buf[32]
+    cdef char s_buf[24]
+    cdef int t_len, h_len, b_len, s_len
+    cdef bytes did, site, value
+    cdef char* out
+    cdef list events = []
+    check_lengths(n, (site_idx, temps, hum, batt, sig))
+
+    for i in range(n):
+        did = pool_item(dids, did_idx[i])
+        site = pool_item(sites, site_idx[i])
+        t_len = format_fixed(t_buf, temps[i], 2)
+        h_len = format_fixed(h_buf, hum[i], 2)
+        b_len = format_fixed(b_buf, batt[i], 1)
+        s_len = snprintf(s_buf, sizeof(s_buf), b"%ld", <long>sig[i])
+
+        size = (IOT_FIXED_LEN + PyBytes_GET_SIZE(did) + PyBytes_GET_SIZE(site)
+                + t_len + h_len + b_len + s_len + PyBytes_GET_SIZE(ts))
+        value = PyBytes_FromStringAndSize(NULL, size)
+        out = PyBytes_AS_STRING(value)
+
+        pos = put(out, 0, I_DEVICE_ID, strlen(I_DEVICE_ID))
+        pos = put_bytes(out, pos, did)
+        pos = put(out, pos, I_SITE, strlen(I_SITE))
+        pos = put_bytes(out, pos, site)
+        pos = put(out, pos, I_TEMP, strlen(I_TEMP))
+        pos = put(out, pos, t_buf, t_len)
+        pos = put(out, pos, I_HUMIDITY, strlen(I_HUMIDITY))
+        pos = put(out, pos, h_buf, h_len)
+        pos = put(out, pos, I_BATTERY, strlen(I_BATTERY))
+        pos = put(out, pos, b_buf, b_len)
+        pos = put(out, pos, I_SIGNAL, strlen(I_SIGNAL))
+        pos = put(out, pos, s_buf, s_len)
+        pos = put(out, pos, I_TS, strlen(I_TS))
+        pos = put_bytes(out, pos, ts)
+        put(out, pos, I_END, strlen(I_END))
+
+        events.append((did, value))
+    return events
@@ -1,5 +1,6 @@
-import os, json, random, time, sys, yaml, threading
-from datetime import datetime, timezone, timedelta
+import os, time, sys, yaml, threading
+import numpy as np
+import orjson
 from faker import Faker
 from confluent_kafka import Producer
 from pathlib import Path
@@ -18,6 +19,7 @@ try:
     eps_click = config.get("data_generator.events_per_second.clickstream", 50)
     eps_iot = config.get("data_generator.events_per_second.iot", 30)
     partitions = config.get("kafka.partitions", 6)
+    value_format = config.get("kafka.value_format", "json")
     print(f"✅ Loaded configuration from config.yml")
 except Exception as e:
     print(f"⚠️  Failed to load config.yml ({e}), falling back to environment variables")
@@ -25,6 +27,7 @@ except Exception as e:
     eps_click = int(os.getenv("EPS_CLICK", "50"))
     eps_iot = int(os.getenv("EPS_IOT", "30"))
     partitions = int(os.getenv("PARTITIONS", "6"))
+    value_format = os.getenv("VALUE_FORMAT", "json")
 
 
 # Simplified Kafka Producer Configuration for Learning
@@ -34,18 +37,24 @@ conf = {
     'client.id': 'learning-producer',
     
     # === BATCHING OPTIMIZATIONS ===
+    # Trade-off: bigger batches and a longer linger mean fewer, larger produce
+    # requests (less broker overhead, better compression ratio) at the cost of
+    # up to linger.ms of extra latency per message. Latency-sensitive setups
+    # should lower linger.ms back to ~5ms.
+    
     # Increase batch size for better throughput (default: 16384 bytes)
     # Larger batches = fewer network requests = higher throughput
-    'batch.size': 32768,  # 32KB batches (2x default, good starting point)
+    'batch.size': 262144,  # 256KB batches
     
-    # Wait time to batch more messages together (default: 0ms)
-    # Small delay allows more messages to accumulate in batches
-    'linger.ms': 5,  # Wait max 5ms to batch messages
+    # Wait time to batch more messages together (default: 5ms)
+    # Delay allows more messages to accumulate in batches
+    'linger.ms': 20,  # Wait max 20ms to batch messages
     
     # === COMPRESSION ===
     # Reduce network bandwidth and improve throughput
     # Options: none, gzip, snappy, lz4, zstd
-    'compression.type': 'lz4',  # Fast compression with good ratio
+    'compression.type': 'zstd',  # Better ratio than lz4 on repetitive JSON, still fast
+    'compression.level': 3,  # Low zstd level keeps producer CPU cost close to lz4
     
     # === RELIABILITY vs PERFORMANCE ===
     # acks=0: No acknowledgment (fastest, but data loss possible)
@@ -57,6 +66,10 @@ conf = {
     # Maximum number of messages buffered per partition (Python client)
     # More buffer = more batching opportunities  
     'queue.buffering.max.messages': 100000,  # Max messages to buffer
+    'queue.buffering.max.kbytes': 1048576,  # Max 1GB buffered (upper bound, not preallocated)
+    
+    # Larger socket buffer so big batches go out without stalling on the kernel
+    'socket.send.buffer.bytes': 1048576,  # 1MB
     
     # === RETRY LOGIC (IMPORTANT TO UNDERSTAND!) ===
     # How many times to retry failed sends (default: 2147483647)
@@ -67,6 +80,21 @@ conf = {
 }
 
 
+# === DELIVERY CALLBACK FOR MONITORING ===
+def delivery_callback(err, msg):
+    # Only failures arrive with delivery.report.only.error, but don't rely on it here
+    if err:
+        monitor.increment('errors')
+        monitor.increment('delivery_failed')
+        print(f"❌ Delivery failed: {err}")
+
+# Register the delivery report once for every message instead of per produce() call.
+# Only failures are reported back to Python; successful deliveries are derived in
+# PerformanceMonitor.report() from the sent, failed and in-flight counts.
+conf['on_delivery'] = delivery_callback
+conf['delivery.report.only.error'] = True
+
+
 # Add connection retry logic
 print(f"🔄 Attempting to connect to Kafka brokers: {bootstrap}")
 for attempt in range(10):
@@ -87,116 +115,203 @@ for attempt in range(10):
 # === PERFORMANCE MONITORING ===
 class PerformanceMonitor:
     def __init__(self):
-        self.stats = defaultdict(int)
+        # Each thread counts into its own dict so increment() never takes a lock;
+        # the dicts are only summed (under the lock) when reporting
+        self.local = threading.local()
+        self.thread_stats = []
         self.start_time = time.time()
         self.last_report = time.time()
         self.lock = threading.Lock()
     
     def increment(self, metric, count=1):
+        try:
+            stats = self.local.stats
+        except AttributeError:
+            stats = self.local.stats = defaultdict(int)
+            with self.lock:
+                self.thread_stats.append(stats)
+        stats[metric] += count
+    
+    @property
+    def stats(self):
+        """Totals across all threads"""
+        totals = defaultdict(int)
         with self.lock:
-            self.stats[metric] += count
+            for stats in self.thread_stats:
+                for metric, count in stats.copy().items():
+                    totals[metric] += count
+        return totals
     
-    def report(self):
+    def report(self, in_flight=0):
+        """Print throughput stats, in_flight is the number of messages still awaiting delivery"""
         current_time = time.time()
         elapsed = current_time - self.last_report
         total_elapsed = current_time - self.start_time
+        stats = self.stats
         
-        with self.lock:
-            total_events = self.stats['clickstream_sent'] + self.stats['iot_sent']
-            events_per_sec = total_events / total_elapsed if total_elapsed > 0 else 0
-            recent_rate = total_events / elapsed if elapsed > 0 else 0
-            
-            print(f"📊 THROUGHPUT STATS:")
-            print(f"   Total Events: {total_events:,}")
-            print(f"   Events/sec: {events_per_sec:.1f} (avg) | {recent_rate:.1f} (recent)")
-            print(f"   Clickstream: {self.stats['clickstream_sent']:,} | IoT: {self.stats['iot_sent']:,}")
-            print(f"   Errors: {self.stats['errors']}")
-            print(f"   Delivery Success: {self.stats['delivered']:,}")
-            
-            self.last_report = current_time
+        total_events = stats['clickstream_sent'] + stats['iot_sent']
+        delivered = max(0, total_events - stats['delivery_failed'] - in_flight)
+        events_per_sec = total_events / total_elapsed if total_elapsed > 0 else 0
+        recent_rate = total_events / elapsed if elapsed > 0 else 0
+        
+        print(f"📊 THROUGHPUT STATS:")
+        print(f"   Total Events: {total_events:,}")
+        print(f"   Events/sec: {events_per_sec:.1f} (avg) | {recent_rate:.1f} (recent)")
+        print(f"   Clickstream: {stats['clickstream_sent']:,} | IoT: {stats['iot_sent']:,}")
+        print(f"   Errors: {stats['errors']}")
+        print(f"   Delivery Success: {delivered:,}")
+        
+        self.last_report = current_time
 
 monitor = PerformanceMonitor()
 
 # === OPTIMIZED DATA GENERATION ===
 fake = Faker()
 
+# Shared vectorized RNG, each batch draws all of its random fields in one call per field
+rng = np.random.default_rng()
+
 # Pre-generate static data for efficiency
 urls = ["/home", "/search", "/product", "/cart", "/checkout", "/help", "/about", "/contact", "/api/v1/products", "/api/v1/users"]
 user_agents = [fake.user_agent() for _ in range(100)]  # Pool of user agents
 cities = [fake.city() for _ in range(50)]  # Pool of cities
+referrers = [fake.uri() for _ in range(16)]  # Pool of referrers, keeps Faker off the hot path
+
+# ISO8601 UTC timestamp straight from time.gmtime, no datetime/timedelta objects involved
+def _fast_iso(t):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(t)) + ".%06dZ" % ((t % 1) * 1_000_000)
 
-# Optimized timestamp generation with slight delay to ensure past timestamps
-def now_iso():
-    # Subtract 30 seconds to ensure events are in the past for watermark processing
-    return (datetime.now(timezone.utc) - timedelta(seconds=30)).isoformat()
+# Random 128-bit hex event ids for a whole batch from a single urandom read
+def random_ids(count):
+    hex_ids = os.urandom(16 * count).hex()
+    return [hex_ids[i:i + 32] for i in range(0, 32 * count, 32)]
 
 # Pre-generate IDs for better performance
 user_ids = [f"u{str(i).zfill(5)}" for i in range(1, 10000)]  # Increased pool size
 device_ids = [f"d{str(i).zfill(5)}" for i in range(1, 5000)]
 
-# Optimized key generation
-click_key = lambda uid: uid.encode()
-iot_key = lambda did: did.encode()
+# Kafka message keys, encoded once per pool instead of once per event
+user_ids_bytes = [uid.encode('ascii') for uid in user_ids]
+device_ids_bytes = [did.encode('ascii') for did in device_ids]
 
-# === DELIVERY CALLBACK FOR MONITORING ===
-def delivery_callback(err, msg):
-    if err:
-        monitor.increment('errors')
-        print(f"❌ Delivery failed: {err}")
-    else:
-        monitor.increment('delivered')
+# === VALUE SERIALIZATION ===
+# Must match kafka.value_format on the Spark side
+if value_format == "protobuf":
+    # events_pb2 is compiled from schemas/events.proto in the Docker image
+    from events_pb2 import ClickEvent, IotEvent
+
+# Clickstream events are all strings with a fixed shape, so their JSON is rendered
+# straight from a template instead of building a dict and encoding it. Free-text
+# fields are substituted as already-escaped JSON literals; the rest are ASCII ids
+# and timestamps. IoT events stay on orjson, which formats floats faster than %r.
+_CLICK_TMPL = '{"event_id":"%s","user_id":"%s","referrer":%s,"session_id":"s%d","ts":"%s",%s'
+
+json_str = lambda s: orjson.dumps(s).decode()
+referrers_json = [json_str(r) for r in referrers]
+
+# Every (url, ua) pair is known up front, so the static tail of a clickstream record
+# is rendered once per pair (10 x 100) instead of once per event
+click_pairs = [(url, ua) for url in urls for ua in user_agents]
+click_tails = ['"url":%s,"ua":%s}' % (json_str(url), json_str(ua)) for url, ua in click_pairs]
+
+# Compiled renderers (generator/_fast_gen.pyx), built in the Docker image; the
+# pure-Python template/orjson paths below are used when it isn't available
+try:
+    import _fast_gen
+    referrers_json_bytes = [r.encode() for r in referrers_json]
+    click_tails_bytes = [t.encode() for t in click_tails]
+    cities_json_bytes = [orjson.dumps(c) for c in cities]
+except ImportError:
+    _fast_gen = None
 
 # === BATCH EVENT GENERATION ===
 class EventGenerator:
-    def __init__(self):
-        self.timestamp_cache = ""
-        self.last_timestamp_update = 0
-    
-    def get_timestamp(self):
-        # Reduce cache time to 1 second and ensure fresh timestamps
-        current_time = time.time()
-        if current_time - self.last_timestamp_update > 1.0:  # Cache for 1 second instead of 100ms
-            self.timestamp_cache = now_iso()
-            self.last_timestamp_update = current_time
-        return self.timestamp_cache
+    def batch_timestamp(self):
+        # One timestamp per batch, 30 seconds in the past so events land behind the watermark
+        return _fast_iso(time.time() - 30)
     
     def generate_clickstream_batch(self, count):
-        """Generate multiple clickstream events efficiently"""
-        events = []
-        timestamp = self.get_timestamp()
+        """Generate multiple serialized clickstream events efficiently, as (key, value) byte pairs"""
+        timestamp = self.batch_timestamp()
         
-        for _ in range(count):
-            uid = random.choice(user_ids)
-            evt = {
-                "event_id": fake.uuid4(),
-                "user_id": uid,
-                "url": random.choice(urls),
-                "referrer": fake.uri(),
-                "ua": random.choice(user_agents),  # Use pre-generated user agents
-                "session_id": f"s{random.randint(100000, 999999)}",  # Add session tracking
-                "ts": timestamp
-            }
-            events.append((uid, evt))
-        return events
+        # Draw every random field for the whole batch at once (tolist() yields plain Python types)
+        uid_idx = rng.integers(0, len(user_ids), count).tolist()
+        pair_idx = rng.integers(0, len(click_pairs), count).tolist()  # (url, pre-generated user agent)
+        sessions = rng.integers(100000, 1000000, count).tolist()  # Add session tracking
+        ref_idx = rng.integers(0, len(referrers), count).tolist()
+        
+        if value_format == "json" and _fast_gen is not None:
+            return _fast_gen.render_clickstream(
+                os.urandom(16 * count), uid_idx, pair_idx, ref_idx, sessions,
+                timestamp.encode(), user_ids_bytes, referrers_json_bytes, click_tails_bytes
+            )
+        
+        event_ids = random_ids(count)
+        if value_format == "protobuf":
+            return [
+                (user_ids_bytes[u], ClickEvent(
+                    event_id=eid,
+                    user_id=user_ids[u],
+                    url=click_pairs[p][0],
+                    referrer=referrers[ref],
+                    ua=click_pairs[p][1],
+                    session_id=f"s{sid}",
+                    ts=timestamp
+                ).SerializeToString())
+                for eid, u, p, ref, sid in zip(event_ids, uid_idx, pair_idx, ref_idx, sessions)
+            ]
+        
+        return [
+            (user_ids_bytes[u], (_CLICK_TMPL % (
+                eid, user_ids[u], referrers_json[ref], sid, timestamp, click_tails[p]
+            )).encode())
+            for eid, u, p, ref, sid in zip(event_ids, uid_idx, pair_idx, ref_idx, sessions)
+        ]
     
     def generate_iot_batch(self, count):
-        """Generate multiple IoT events efficiently"""
-        events = []
-        timestamp = self.get_timestamp()
+        """Generate multiple serialized IoT events efficiently, as (key, value) byte pairs"""
+        timestamp = self.batch_timestamp()
+        
+        # Draw every random field for the whole batch at once (tolist() yields plain Python types)
+        did_idx = rng.integers(0, len(device_ids), count).tolist()
+        site_idx = rng.integers(0, len(cities), count).tolist()  # Use pre-generated cities
+        temps = rng.uniform(15, 40, count).round(2).tolist()
+        hum = rng.uniform(10, 90, count).round(2).tolist()
+        batt = rng.uniform(20, 100, count).round(1).tolist()
+        sig = rng.integers(-100, -29, count).tolist()  # Add more sensor data
+        
+        if value_format == "json" and _fast_gen is not None:
+            return _fast_gen.render_iot(
+                did_idx, site_idx, temps, hum, batt, sig,
+                timestamp.encode(), device_ids_bytes, cities_json_bytes
+            )
+        
+        if value_format == "protobuf":
+            return [
+                (device_ids_bytes[d], IotEvent(
+                    device_id=device_ids[d],
+                    site=cities[c],
+                    temp_c=t,
+                    humidity=h,
+                    battery=b,
+                    signal_strength=ss,
+                    ts=timestamp
+                ).SerializeToString())
+                for d, c, t, h, b, ss in zip(did_idx, site_idx, temps, hum, batt, sig)
+            ]
         
-        for _ in range(count):
-            did = random.choice(device_ids)
-            evt = {
-                "device_id": did,
-                "site": random.choice(cities),  # Use pre-generated cities
-                "temp_c": round(random.uniform(15, 40), 2),
-                "humidity": round(random.uniform(10, 90), 2),
-                "battery": round(random.uniform(20, 100), 1),
-                "signal_strength": random.randint(-100, -30),  # Add more sensor data
+        return [
+            (device_ids_bytes[d], orjson.dumps({
+                "device_id": device_ids[d],
+                "site": cities[c],
+                "temp_c": t,
+                "humidity": h,
+                "battery": b,
+                "signal_strength": ss,
                 "ts": timestamp
-            }
-            events.append((did, evt))
-        return events
+            }))
+            for d, c, t, h, b, ss in zip(did_idx, site_idx, temps, hum, batt, sig)
+        ]
 
 event_generator = EventGenerator()
 
@@ -208,66 +323,104 @@ class HighThroughputProducer:
         self.target_eps_click = target_eps_click
         self.target_eps_iot = target_eps_iot
         self.running = True
-        self.batch_size = 50  # Send events in batches for efficiency
+        # Send events in batches for efficiency, librdkafka's linger.ms/batch.size
+        # do the network-level batching; capped to ~1s of traffic per stream
+        self.batch_size = 500
+        self.click_batch_size = max(1, min(self.batch_size, int(target_eps_click)))
+        self.iot_batch_size = max(1, min(self.batch_size, int(target_eps_iot)))
+        # Back-pressure threshold: stop enqueueing once the local queue is 90% full
+        self.max_in_flight = int(conf['queue.buffering.max.messages'] * 0.9)
         
     def stop(self):
         self.running = False
     
+    def wait_for_deadline(self, next_deadline, interval):
+        """
+        Sleep until next_deadline and return the deadline after it
+        Deadlines advance by a fixed interval, so time spent producing doesn't add drift
+        """
+        now = time.monotonic()
+        if next_deadline > now:
+            time.sleep(next_deadline - now)
+        elif now - next_deadline > 1.0:
+            # More than a second behind (e.g. a broker stall): resync instead of bursting to catch up
+            next_deadline = now
+        return next_deadline + interval
+    
+    def produce_events(self, topic, events):
+        """
+        Enqueue a batch of (key, value) pairs, returns how many were enqueued
+        Blocks while the local queue is near full, and retries a produce rejected with
+        BufferError after letting librdkafka drain, so no event of the batch is dropped
+        """
+        # len(producer) is librdkafka's count of messages awaiting delivery
+        while len(self.producer) > self.max_in_flight and self.running:
+            self.producer.poll(0.01)
+        
+        # Bound method hoisted out of the loop
+        produce = self.producer.produce
+        sent = 0
+        for key, payload in events:
+            while True:
+                try:
+                    produce(topic, key=key, value=payload)
+                    break
+                except BufferError:
+                    # Queue full: serve delivery callbacks until there is room, then retry this event
+                    if not self.running:
+                        return sent
+                    self.producer.poll(0.1)
+            sent += 1
+        return sent
+    
     def produce_clickstream_batch(self):
         """Produce clickstream events in batches for maximum throughput"""
+        # Pace batches to the target throughput
+        interval = self.click_batch_size / self.target_eps_click
+        next_deadline = time.monotonic()
         while self.running:
+            next_deadline = self.wait_for_deadline(next_deadline, interval)
+            if not self.running:
+                # stop() was called while sleeping, don't enqueue a batch after the final flush
+                break
             try:
                 # Generate batch of events
-                events = event_generator.generate_clickstream_batch(self.batch_size)
+                events = event_generator.generate_clickstream_batch(self.click_batch_size)
                 
                 # Produce all events in the batch
-                for uid, evt in events:
-                    self.producer.produce(
-                        "clickstream",
-                        key=click_key(uid),
-                        value=json.dumps(evt).encode(),
-                        callback=delivery_callback
-                    )
-                    monitor.increment('clickstream_sent')
+                monitor.increment('clickstream_sent', self.produce_events("clickstream", events))
                 
                 # Non-blocking poll to handle delivery callbacks
                 self.producer.poll(0)
                 
-                # Dynamic sleep to achieve target throughput
-                # Calculate sleep time based on target events per second
-                sleep_time = self.batch_size / self.target_eps_click
-                time.sleep(max(0.001, sleep_time))  # Minimum 1ms sleep
-                
             except Exception as e:
+                # Unexpected errors only, a full queue is handled in produce_events
                 print(f"❌ Error in clickstream production: {e}")
                 monitor.increment('errors')
                 time.sleep(0.1)
     
     def produce_iot_batch(self):
         """Produce IoT events in batches for maximum throughput"""
+        # Pace batches to the target throughput
+        interval = self.iot_batch_size / self.target_eps_iot
+        next_deadline = time.monotonic()
         while self.running:
+            next_deadline = self.wait_for_deadline(next_deadline, interval)
+            if not self.running:
+                # stop() was called while sleeping, don't enqueue a batch after the final flush
+                break
             try:
                 # Generate batch of events
-                events = event_generator.generate_iot_batch(self.batch_size)
+                events = event_generator.generate_iot_batch(self.iot_batch_size)
                 
                 # Produce all events in the batch
-                for did, evt in events:
-                    self.producer.produce(
-                        "iot",
-                        key=iot_key(did),
-                        value=json.dumps(evt).encode(),
-                        callback=delivery_callback
-                    )
-                    monitor.increment('iot_sent')
+                monitor.increment('iot_sent', self.produce_events("iot", events))
                 
                 # Non-blocking poll to handle delivery callbacks
                 self.producer.poll(0)
                 
-                # Dynamic sleep to achieve target throughput
-                sleep_time = self.batch_size / self.target_eps_iot
-                time.sleep(max(0.001, sleep_time))
-                
             except Exception as e:
+                # Unexpected errors only, a full queue is handled in produce_events
                 print(f"❌ Error in IoT production: {e}")
                 monitor.increment('errors')
                 time.sleep(0.1)
@@ -276,7 +429,7 @@ class HighThroughputProducer:
         """Background thread to monitor and report performance"""
         while self.running:
             time.sleep(10)  # Report every 10 seconds
-            monitor.report()
+            monitor.report(len(self.producer))
     
     def flush_producer(self):
         """Background thread to periodically flush the producer"""
@@ -300,7 +453,7 @@ def signal_handler(signum, frame):
         print("✅ All messages delivered successfully")
     
     # Final stats
-    monitor.report()
+    monitor.report(remaining)
     exit(0)
 
 # Register signal handlers for graceful shutdown
@@ -316,8 +469,9 @@ target_iot_eps = eps_iot * 3  # 3x the original rate
 print(f"🚀 Starting ENHANCED producer for learning:")
 print(f"   Target Clickstream: {target_clickstream_eps} events/sec")
 print(f"   Target IoT: {target_iot_eps} events/sec")
-print(f"   Kafka Configuration: LZ4 compression, 32KB batches, 5ms linger")
+print(f"   Kafka Configuration: zstd compression, 256KB batches, 20ms linger, {value_format} values")
 print(f"   Retry Logic: 5 retries with 1 second backoff")
+print(f"   Event Rendering: {'compiled (_fast_gen)' if _fast_gen is not None else 'pure Python'}")
 print(f"   Press Ctrl+C for graceful shutdown\n")
 
 high_throughput_producer = HighThroughputProducer(
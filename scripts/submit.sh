@@ -14,7 +14,7 @@ echo "Submitting Spark streaming ETL job..."
 
 /opt/spark/bin/spark-submit \
     --master spark://spark-master:7077 \
-    --packages org.apache.spark:spark-sql-kafka-0-10_2.12:3.5.1 \
+    --packages org.apache.spark:spark-sql-kafka-0-10_2.12:3.5.1,org.apache.spark:spark-protobuf_2.12:3.5.1 \
     --repositories https://repo1.maven.org/maven2/ \
     --conf "spark.jars.ivy=/tmp/.ivy2" \
     --conf "spark.sql.streaming.forceDeleteTempCheckpointLocation=true" \
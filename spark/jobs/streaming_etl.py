@@ -9,18 +9,22 @@ try:
     # Add parent directory to path to import config_loader
     sys.path.append("/opt")
     import yaml
+    Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     
     # Load config.yml if available
     config_path = "/opt/config.yml"
     if os.path.exists(config_path):
         with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
+            config = yaml.load(f, Loader=Loader)
         
         bootstrap = config.get('kafka', {}).get('bootstrap_servers', "kafka-1:9092,kafka-2:9092,kafka-3:9092")
         checkpoint_root = config.get('storage', {}).get('checkpoint_root', "/checkpoints") + "/streaming_etl"
         delta_root = config.get('storage', {}).get('datalake_root', "/datalake")
         clickstream_topic = config.get('topics', {}).get('clickstream', "clickstream")
         iot_topic = config.get('topics', {}).get('iot', "iot")
+        value_format = config.get('kafka', {}).get('value_format', "json")
+        json_parser = config.get('spark', {}).get('json_parser', "native")
+        spark_cores = config.get('spark', {}).get('worker_cores', 2)
         
         print(f"✅ Loaded configuration from {config_path}")
     else:
@@ -33,10 +37,28 @@ except Exception as e:
     delta_root = "/datalake"
     clickstream_topic = "clickstream"
     iot_topic = "iot"
+    value_format = "json"
+    json_parser = "native"
+    spark_cores = 2
 
+# The simdjson decoder is only installed in images built with SPARK_SIMDJSON=true
+if json_parser == "simdjson":
+    try:
+        import pandas, pyarrow, simdjson
+    except ImportError as e:
+        print(f"⚠️  json_parser simdjson unavailable ({e}), using native from_json")
+        json_parser = "native"
+
+# Descriptor set compiled from schemas/events.proto in the Spark image
+proto_desc_path = "/opt/schemas/events.desc"
 
 spark = (SparkSession.builder
 .appName("MiniCluster-Streaming-ETL")
+# Default of 200 shuffle partitions makes tiny files and state stores per micro-batch
+# (stateful queries keep the value recorded in their checkpoint)
+.config("spark.sql.shuffle.partitions", str(spark_cores * 2))
+# Bound how much state-store/checkpoint history is kept for the dedup and aggregation state
+.config("spark.sql.streaming.minBatchesToRetain", "20")
 .getOrCreate())
 
 
@@ -65,6 +87,85 @@ StructField("ts", StringType()), # ISO8601
 ])
 
 
+def simdjson_decoder(schema):
+    """
+    mapInArrow function that parses the binary value column with simdjson
+    Only the fields in schema are pulled out. Records that aren't JSON objects become
+    all-null rows; a field whose JSON type doesn't fit its column (e.g. 1.5 or true for
+    an integer, a number for a string, any nested value) becomes null
+    """
+    names = schema.fieldNames()
+
+    def decode(batches):
+        import pyarrow as pa
+        import simdjson
+        from pyspark.sql.pandas.types import to_arrow_schema
+
+        arrow_schema = to_arrow_schema(schema)
+        parser = simdjson.Parser()
+        nested = (simdjson.Object, simdjson.Array)
+        # JSON value types each column accepts; type() is exact, so bools don't pass as ints
+        accepted = {
+            pa.string(): (str,),
+            pa.int32(): (int,),
+            pa.int64(): (int,),
+            pa.float64(): (int, float),
+        }
+
+        def to_array(column, arrow_type):
+            allowed = accepted.get(arrow_type)
+            if allowed is not None:
+                column = [field if type(field) in allowed else None for field in column]
+            try:
+                return pa.array(column, type=arrow_type)
+            except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+                # Slow path for a batch with bad fields: null out the ones that don't convert
+                checked = []
+                for field in column:
+                    try:
+                        pa.scalar(field, type=arrow_type)
+                        checked.append(field)
+                    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+                        checked.append(None)
+                return pa.array(checked, type=arrow_type)
+
+        for batch in batches:
+            columns = [[] for _ in names]
+            for value in batch.column("value").to_pylist():
+                doc = None
+                row = [None] * len(names)
+                try:
+                    doc = parser.parse(value)
+                    if isinstance(doc, simdjson.Object):
+                        row = [doc.get(name) for name in names]
+                        # Nested values are proxies into the parser, treat them as mismatched types
+                        row = [None if isinstance(field, nested) else field for field in row]
+                except (ValueError, TypeError):
+                    pass
+                finally:
+                    # The parser can't be reused while a proxy into its last document is alive
+                    del doc
+                for column, field in zip(columns, row):
+                    column.append(field)
+            arrays = [to_array(column, arrow_schema.field(i).type) for i, column in enumerate(columns)]
+            yield pa.RecordBatch.from_arrays(arrays + [batch.column("timestamp")], names=names + ["timestamp"])
+
+    return decode
+
+
+def parse_value(raw, schema, message_name):
+    """Decode the Kafka value column into event fields according to value_format"""
+    if value_format == "protobuf":
+        from pyspark.sql.protobuf.functions import from_protobuf
+        evt = from_protobuf(col("value"), message_name, proto_desc_path)
+    elif json_parser == "simdjson":
+        out_schema = StructType(schema.fields + [StructField("timestamp", TimestampType())])
+        return raw.select("value", "timestamp").mapInArrow(simdjson_decoder(schema), out_schema)
+    else:
+        evt = from_json(col("value").cast("string"), schema)
+    return raw.select(evt.alias("evt"), "timestamp").select("evt.*", "timestamp")
+
+
 # --------- Clickstream ---------
 raw_click = (spark.readStream
 .format("kafka")
@@ -74,15 +175,16 @@ raw_click = (spark.readStream
 .load())
 
 
-click = (raw_click
-.selectExpr("CAST(key AS STRING) AS k", "CAST(value AS STRING) AS v", "timestamp")
-.withColumn("json", from_json(col("v"), click_schema))
-.select("json.*", "timestamp")
+click = (parse_value(raw_click, click_schema, "streaming.ClickEvent")
 .withColumn("event_ts", to_timestamp(col("ts")))
 .withColumn("ingest_ts", current_timestamp())
 .withColumn("dt", to_date(col("event_ts")))
+.withColumn("hr", hour(col("event_ts")))
 .withWatermark("event_ts", "2 minutes")
-.dropDuplicates(["event_id"]))
+# event_id isn't an event-time column, so plain dropDuplicates would keep every id in
+# state forever; WithinWatermark evicts each id once the watermark passes it.
+# Producer retries (no idempotence) can still write duplicates, so dedup stays.
+.dropDuplicatesWithinWatermark(["event_id"]))
 
 
 q_click = (click.writeStream
@@ -90,7 +192,7 @@ q_click = (click.writeStream
 .outputMode("append")
 .option("checkpointLocation", f"{checkpoint_root}/clickstream")
 .option("path", f"{delta_root}/tables/clickstream")
-.partitionBy("dt")
+.partitionBy("dt", "hr")
 .trigger(processingTime="5 seconds")
 .start())
 
@@ -100,7 +202,8 @@ click_agg = (click
 .groupBy(window(col("event_ts"), "1 minute"), col("url"))
 .agg(count("*").alias("pv"))
 .select(col("window.start").alias("minute_start"), col("window.end").alias("minute_end"), "url", "pv")
-.withColumn("dt", to_date(col("minute_start"))))
+.withColumn("dt", to_date(col("minute_start")))
+.withColumn("hr", hour(col("minute_start"))))
 
 
 q_click_agg = (click_agg.writeStream
@@ -108,7 +211,7 @@ q_click_agg = (click_agg.writeStream
 .outputMode("append")
 .option("checkpointLocation", f"{checkpoint_root}/clickstream_agg")
 .option("path", f"{delta_root}/tables/clickstream_agg")
-.partitionBy("dt")
+.partitionBy("dt", "hr")
 .trigger(processingTime="10 seconds")
 .start())
 
@@ -121,14 +224,13 @@ raw_iot = (spark.readStream
 .load())
 
 
-iot = (raw_iot
-.selectExpr("CAST(key AS STRING) AS k", "CAST(value AS STRING) AS v", "timestamp")
-.withColumn("json", from_json(col("v"), iot_schema))
-.select("json.*", "timestamp")
+iot = (parse_value(raw_iot, iot_schema, "streaming.IotEvent")
 .withColumn("event_ts", to_timestamp(col("ts")))
 .withColumn("ingest_ts", current_timestamp())
 .withColumn("dt", to_date(col("event_ts")))
+.withColumn("hr", hour(col("event_ts")))
 .withWatermark("event_ts", "2 minutes")
+# Keyed on event_ts, so state is already evicted by the watermark
 .dropDuplicates(["device_id", "event_ts"]))
 
 
@@ -137,7 +239,7 @@ q_iot = (iot.writeStream
 .outputMode("append")
 .option("checkpointLocation", f"{checkpoint_root}/iot")
 .option("path", f"{delta_root}/tables/iot")
-.partitionBy("dt")
+.partitionBy("dt", "hr")
 .trigger(processingTime="5 seconds")
 .start())
 